@@ -16,302 +16,405 @@ and watched status for seamless import into Trakt.
 from __future__ import annotations
 
 import argparse
+import codecs
 import json
 import re
 import sys
+from collections import Counter
 from datetime import datetime
 from html.parser import HTMLParser
-from typing import TextIO
+from itertools import chain
+from typing import Iterable, Iterator, Mapping, TextIO
 from urllib.parse import unquote
 
+try:
+    from lxml import etree  # type: ignore[import-untyped]
+except ImportError:  # lxml is optional; fall back to html.parser
+    etree = None  # type: ignore[assignment]
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the json module
+    orjson = None  # type: ignore[assignment]
+
 __version__ = "1.0.0"
 
+# Input is read and parsed in blocks of this many bytes
+CHUNK_SIZE = 65536
+
+# Patterns used on every start tag; compiled once at import time
+# Media type and IMDB ID, plus season/episode when the href points at an
+# episode (either .../tt5875444:5:3 or .../tt5875444/tt5875444:5:3)
+_HREF_RE = re.compile(r'#/detail/(movie|series)/(tt\d+)(?:/tt\d+)?(?::(\d+):(\d+))?')
+# Fallback for an S:E triplet anywhere else in the href
+_EP_RE = re.compile(r'tt\d+:(\d+):(\d+)')
+_PROGRESS_RE = re.compile(r'width:\s*(\d+\.?\d*|\.\d+)%')
+_BGIMG_RE = re.compile(r'background-image:\s*url\(["\']?([^"\')\s]+)["\']?\)')
+_POSTER_SHAPE_RE = re.compile(r'poster-shape-(\w+)')
+_YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+
+_TEXT_TAGS = frozenset(('div', 'span', 'p'))
+
+
+def _has_class(classes: str, name: str) -> bool:
+    """
+    Check whether a class attribute contains the class ``name``.
+
+    Stremio's CSS modules append a build hash to class names
+    (e.g. ``progress-bar-Xk3f1``), so a token also matches when it starts
+    with ``name`` followed by a hyphen: ``progress-bar`` matches that class
+    but not ``non-progress-barred``.
+    """
+    if name not in classes:
+        return False
+    prefix = name + '-'
+    return any(token == name or token.startswith(prefix) for token in classes.split())
+
 
 class StremioHTMLParser(HTMLParser):
-    def __init__(self):
+    def __init__(self) -> None:
         super().__init__()
-        self.items = []
-        self.current_item = None
-        self.in_meta_item = False
-        self.in_title_label = False
-        self.capture_text = False
-        self.current_text_field = None
-
-    def handle_starttag(self, tag, attrs):
-        attrs_dict = dict(attrs)
+        self.items: list[dict] = []
+        self.current_item: dict | None = None
+        self.in_meta_item: bool = False
+        self.in_title_label: bool = False
+        self.capture_text: bool = False
+        self.current_text_field: str | None = None
+        self.pending_text: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        # Outside a media item only <a> tags matter, so skip building the
+        # attribute dict for everything else (head, scripts, page layout)
+        if tag != 'a' and not self.current_item:
+            return
+        # html.parser reports valueless attributes as None; lxml uses ''
+        self._handle_start(tag, {k: '' if v is None else v for k, v in attrs})
+
+    def _handle_start(self, tag: str, attrs_dict: Mapping[str, str]) -> None:
+        if self.pending_text:
+            self._flush_text()
 
         # Look for meta item containers (the <a> tags with media info)
         if tag == 'a' and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            if 'meta-item-container' in classes:
+            if _has_class(attrs_dict['class'], 'meta-item-container'):
                 self.in_meta_item = True
                 href = attrs_dict.get('href', '')
                 title = attrs_dict.get('title', '')
 
-                # Extract IMDB ID and type from href
+                # Extract IMDB ID, type and episode info from href in one scan
                 # Format: #/detail/series/tt5875444 or #/detail/movie/tt12820516
-                imdb_match = re.search(r'#/detail/(movie|series)/(tt\d+)', href)
-
-                if imdb_match:
-                    media_type = imdb_match.group(1)
-                    imdb_id = imdb_match.group(2)
-
-                    # Check for episode info in href
-                    # Format: tt5875444:5:3 means season 5, episode 3
-                    episode_match = re.search(r'(tt\d+):(\d+):(\d+)', href)
-
-                    self.current_item = {
+                # Episodes end in tt5875444:5:3, meaning season 5, episode 3
+                href_match = _HREF_RE.search(href) if '#/detail/' in href else None
+
+                if href_match:
+                    media_type, imdb_id, season, episode = href_match.groups()
+                    if season is None and ':' in href:
+                        episode_match = _EP_RE.search(href)
+                        if episode_match:
+                            season, episode = episode_match.groups()
+
+                    # Optional fields (season, poster_url, year, ...) are
+                    # only added once found, so no None cleanup is needed
+                    new_item = {
                         'imdb_id': imdb_id,
                         'title': title,
                         'type': 'show' if media_type == 'series' else 'movie',
                         'href': href,
                         'is_watched': False,
                         'progress': 0,
-                        'season': None,
-                        'episode': None,
-                        'poster_url': None,
-                        'poster_shape': None,
-                        'year': None,
-                        'duration': None,
-                        'episode_title': None,
-                        'release_info': None,
                     }
 
-                    if episode_match:
-                        self.current_item['season'] = int(episode_match.group(2))
-                        self.current_item['episode'] = int(episode_match.group(3))
+                    if season is not None:
+                        new_item['season'] = int(season)
+                        new_item['episode'] = int(episode)
 
                     # Store all data attributes
                     for key, value in attrs_dict.items():
                         if key.startswith('data-'):
-                            self.current_item[key] = value
-
-        # Check for watched icon
-        if self.current_item and tag == 'div' and 'class' in attrs_dict:
-            if 'watched-icon-layer' in attrs_dict.get('class', ''):
-                self.current_item['is_watched'] = True
-
-        # Check for progress bar (multiple possible class name patterns)
-        if self.current_item and tag == 'div' and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            if 'progress-bar' in classes or 'progressBar' in classes.lower():
-                style = attrs_dict.get('style', '')
-                progress_match = re.search(r'width:\s*([\d.]+)%', style)
-                if progress_match:
-                    self.current_item['progress'] = float(progress_match.group(1))
-
-        # Extract poster image from background-image style
-        if self.current_item and tag == 'div' and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            style = attrs_dict.get('style', '')
-            if 'poster' in classes.lower() or 'thumbnail' in classes.lower() or 'image' in classes.lower():
-                # Extract URL from background-image: url("...")
-                url_match = re.search(r'background-image:\s*url\(["\']?([^"\')\s]+)["\']?\)', style)
-                if url_match:
-                    self.current_item['poster_url'] = unquote(url_match.group(1))
-                # Check for poster shape class
-                if 'poster-shape' in classes:
-                    shape_match = re.search(r'poster-shape-(\w+)', classes)
-                    if shape_match:
-                        self.current_item['poster_shape'] = shape_match.group(1)
+                            new_item[key] = value
+
+                    self.current_item = new_item
+
+        item = self.current_item
+        if not item:
+            return
 
         # Extract poster from img tag
-        if self.current_item and tag == 'img':
+        if tag == 'img':
             src = attrs_dict.get('src', '')
-            if src and not self.current_item['poster_url']:
-                self.current_item['poster_url'] = unquote(src)
+            if src and 'poster_url' not in item:
+                item['poster_url'] = unquote(src)
             alt = attrs_dict.get('alt', '')
-            if alt and not self.current_item['title']:
-                self.current_item['title'] = alt
-
-        # Look for title/name labels
-        if self.current_item and tag in ('div', 'span', 'p') and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            if 'title' in classes.lower() or 'name' in classes.lower() or 'label' in classes.lower():
-                self.capture_text = True
-                self.current_text_field = 'title_text'
-
-        # Look for year/release info
-        if self.current_item and tag in ('div', 'span', 'p') and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            if 'year' in classes.lower() or 'release' in classes.lower() or 'date' in classes.lower():
-                self.capture_text = True
-                self.current_text_field = 'release_info'
-
-        # Look for duration info
-        if self.current_item and tag in ('div', 'span', 'p') and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            if 'duration' in classes.lower() or 'runtime' in classes.lower() or 'time' in classes.lower():
-                self.capture_text = True
-                self.current_text_field = 'duration'
+            if alt and not item['title']:
+                item['title'] = alt
+
+        elif tag in _TEXT_TAGS and 'class' in attrs_dict:
+            classes = attrs_dict['class']
+            classes_lower = classes.lower()
+
+            if tag == 'div':
+                # Check for watched icon
+                if _has_class(classes, 'watched-icon-layer'):
+                    item['is_watched'] = True
+
+                # Check for progress bar (progress-bar, or progressBar in any case)
+                if _has_class(classes, 'progress-bar') or _has_class(classes_lower, 'progressbar'):
+                    style = attrs_dict.get('style', '')
+                    if 'width' in style:
+                        progress_match = _PROGRESS_RE.search(style)
+                        if progress_match:
+                            item['progress'] = float(progress_match.group(1))
+
+                # Extract poster image from background-image style
+                if 'poster' in classes_lower or 'thumbnail' in classes_lower or 'image' in classes_lower:
+                    # Extract URL from background-image: url("...")
+                    style = attrs_dict.get('style', '')
+                    if 'background-image' in style:
+                        url_match = _BGIMG_RE.search(style)
+                        if url_match:
+                            item['poster_url'] = unquote(url_match.group(1))
+                    # Check for poster shape class
+                    if _has_class(classes, 'poster-shape'):
+                        shape_match = _POSTER_SHAPE_RE.search(classes)
+                        if shape_match:
+                            item['poster_shape'] = shape_match.group(1)
+
+            # Pick the text field to capture; more specific labels win
+            if 'episode' in classes_lower and 'title' in classes_lower:
+                text_field = 'episode_title'
+            elif 'duration' in classes_lower or 'runtime' in classes_lower or 'time' in classes_lower:
+                text_field = 'duration'
+            elif 'year' in classes_lower or 'release' in classes_lower or 'date' in classes_lower:
+                text_field = 'release_info'
+            elif 'title' in classes_lower or 'name' in classes_lower or 'label' in classes_lower:
+                text_field = 'title_text'
+            else:
+                text_field = None
 
-        # Look for episode title
-        if self.current_item and tag in ('div', 'span', 'p') and 'class' in attrs_dict:
-            classes = attrs_dict.get('class', '')
-            if 'episode' in classes.lower() and 'title' in classes.lower():
+            if text_field:
                 self.capture_text = True
-                self.current_text_field = 'episode_title'
+                self.current_text_field = text_field
 
         # Extract any inline styles that might contain useful info
-        if self.current_item and 'style' in attrs_dict:
+        if 'style' in attrs_dict:
             style = attrs_dict.get('style', '')
             # Look for any background images we might have missed
-            if 'background-image' in style and not self.current_item['poster_url']:
-                url_match = re.search(r'background-image:\s*url\(["\']?([^"\')\s]+)["\']?\)', style)
+            if 'background-image' in style and 'poster_url' not in item:
+                url_match = _BGIMG_RE.search(style)
                 if url_match:
-                    self.current_item['poster_url'] = unquote(url_match.group(1))
-
-    def handle_data(self, data):
-        if self.current_item and self.capture_text and data.strip():
-            text = data.strip()
+                    item['poster_url'] = unquote(url_match.group(1))
+
+    def handle_data(self, data: str) -> None:
+        # A text run can arrive in pieces (lxml splits around entities like
+        # &amp;, and html.parser splits at chunk boundaries), so collect it
+        # here and process it whole at the next tag
+        if self.current_item and self.capture_text:
+            self.pending_text.append(data)
+
+    def _flush_text(self) -> None:
+        text = ''.join(self.pending_text).strip()
+        self.pending_text.clear()
+        item = self.current_item
+        if text and item:
             if self.current_text_field == 'release_info':
-                self.current_item['release_info'] = text
+                item['release_info'] = text
                 # Try to extract year
-                year_match = re.search(r'\b(19|20)\d{2}\b', text)
+                year_match = _YEAR_RE.search(text)
                 if year_match:
-                    self.current_item['year'] = int(year_match.group(0))
+                    item['year'] = int(year_match.group(0))
             elif self.current_text_field == 'duration':
-                self.current_item['duration'] = text
+                item['duration'] = text
             elif self.current_text_field == 'episode_title':
-                self.current_item['episode_title'] = text
+                item['episode_title'] = text
             elif self.current_text_field == 'title_text':
                 # Only update if we don't have a title yet
-                if not self.current_item['title']:
-                    self.current_item['title'] = text
+                if not item['title']:
+                    item['title'] = text
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.pending_text:
+            self._flush_text()
 
-    def handle_endtag(self, tag):
-        if tag in ('div', 'span', 'p'):
+        if tag in _TEXT_TAGS:
             self.capture_text = False
             self.current_text_field = None
 
         if tag == 'a' and self.in_meta_item:
             if self.current_item:
-                # Clean up None values for cleaner output
-                self.current_item = {k: v for k, v in self.current_item.items() if v is not None}
                 self.items.append(self.current_item)
                 self.current_item = None
             self.in_meta_item = False
 
 
-def parse_stremio_html(html_content: str) -> list[dict]:
-    """Parse Stremio HTML and extract media items."""
-    parser = StremioHTMLParser()
-    parser.feed(html_content)
-    return parser.items
+class _LxmlTarget:
+    """lxml parser target that forwards events to a StremioHTMLParser."""
 
+    def __init__(self, parser: StremioHTMLParser) -> None:
+        self.parser = parser
 
-def convert_to_trakt_format(
-    items: list[dict],
-    add_watchlist: bool = True,
-    mark_unknown_dates: bool = True,
-) -> list[dict]:
-    """
-    Convert parsed items to Trakt import format.
+    def start(self, tag: str, attrib: dict[str, str]) -> None:
+        if tag == 'a' or self.parser.current_item:
+            self.parser._handle_start(tag, attrib)
 
-    Args:
-        items: List of parsed media items
-        add_watchlist: Add watchlisted_at to all items (default True)
-        mark_unknown_dates: Use 'unknown' for watched_at if no date available
+    def end(self, tag: str) -> None:
+        self.parser.handle_endtag(tag)
 
-    Returns:
-        List of items in Trakt import format
-    """
-    trakt_items = []
+    def data(self, data: str) -> None:
+        self.parser.handle_data(data)
 
-    for item in items:
-        trakt_item = {
-            'imdb_id': item.get('imdb_id'),
-            'type': item.get('type'),
-        }
+    def close(self) -> list[dict]:
+        return self.parser.items
 
-        # Add title
-        if item.get('title'):
-            trakt_item['title'] = item['title']
 
-        # Add episode info if present
-        if item.get('season') is not None and item.get('episode') is not None:
-            trakt_item['type'] = 'episode'
-            trakt_item['season'] = item['season']
-            trakt_item['episode'] = item['episode']
+def iter_stremio_items(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Parse UTF-8 encoded Stremio HTML incrementally and yield media items.
+
+    Each item is yielded as soon as its container has been parsed, so
+    memory use does not grow with the size of the export. With lxml
+    installed the raw bytes go straight to its C parser; otherwise they
+    are decoded incrementally for html.parser.
+
+    The backends can disagree on the same file. libxml2 applies HTML4
+    content rules and closes an open <a> at <table> or <fieldset>, although
+    both are valid inside <a> in HTML5, so under lxml anything after them
+    (progress bar, watched icon, ...) is lost from the item. They also
+    recover differently from broken markup, such as an unclosed meta-item
+    <a> or an end tag like </li> closing an item early.
+    """
+    parser = StremioHTMLParser()
 
-        # Add watchlisted_at for all items (this is the most important field)
-        if add_watchlist:
-            trakt_item['watchlisted_at'] = datetime.now().isoformat() + 'Z'
+    if etree is not None:
+        # The encoding is explicit because HTML copied out of dev tools
+        # carries no <meta charset>, and libxml2 would assume Latin-1
+        # lxml-stubs' ParserTarget also demands comment() and bytes arguments,
+        # neither of which the HTML parser needs here
+        lxml_parser = etree.HTMLParser(target=_LxmlTarget(parser), encoding='utf-8')  # type: ignore[arg-type]
+        feed, close = lxml_parser.feed, lxml_parser.close
+    else:
+        decode = codecs.getincrementaldecoder('utf-8')(errors='replace').decode
 
-        # Determine watched status
-        # Consider watched if progress > 90% or has watched icon
-        is_watched = item.get('is_watched', False) or item.get('progress', 0) > 90
+        def feed(chunk: bytes) -> None:
+            parser.feed(decode(chunk))
 
-        if is_watched:
-            if mark_unknown_dates:
-                trakt_item['watched_at'] = 'unknown'
-            else:
-                trakt_item['watched_at'] = datetime.now().isoformat() + 'Z'
+        def close() -> None:
+            parser.feed(decode(b'', True))
+            parser.close()
 
-        # Add extra fields from HTML
-        if item.get('href'):
-            trakt_item['_href'] = item['href']
-        if item.get('poster_url'):
-            trakt_item['_poster_url'] = item['poster_url']
-        if item.get('progress', 0) > 0:
-            trakt_item['_progress'] = item['progress']
-        if item.get('year'):
-            trakt_item['_year'] = item['year']
-        if item.get('duration'):
-            trakt_item['_duration'] = item['duration']
-        if item.get('episode_title'):
-            trakt_item['_episode_title'] = item['episode_title']
+    for chunk in chunks:
+        feed(chunk)
+        yield from parser.items
+        parser.items.clear()
 
-        trakt_items.append(trakt_item)
+    close()
+    yield from parser.items
 
-    return trakt_items
 
+def parse_stremio_html(html_content: str) -> list[dict]:
+    """Parse Stremio HTML and extract media items."""
+    return list(iter_stremio_items((html_content.encode('utf-8'),)))
 
-def format_for_trakt_import(items: list[dict]) -> list[dict]:
+
+def convert_to_trakt_format(
+    items: Iterable[dict],
+    add_watchlist: bool = True,
+    mark_unknown_dates: bool = True,
+) -> Iterator[dict]:
     """
-    Format items for Trakt import using their exact schema.
+    Convert parsed items to Trakt import format.
 
-    Returns the properly formatted JSON structure for Trakt.
+    Entries are built directly in Trakt's import schema and field order,
+    lazily, one at a time.
+
+    Args:
+        items: Parsed media items
+        add_watchlist: Add watchlisted_at to all items (default True)
+        mark_unknown_dates: Use 'unknown' for watched_at if no date available
+
+    Yields:
+        Entries in Trakt import format
     """
-    formatted = []
+    # Every item in one export shares the same timestamp
+    now_iso = datetime.now().isoformat() + 'Z'
 
     for item in items:
+        get = item.get
+        season = get('season')
+        episode = get('episode')
+        is_episode = season is not None and episode is not None
+        progress = get('progress', 0)
+
         entry = {
             'imdb_id': item['imdb_id'],
-            'type': item['type'],
+            'type': 'episode' if is_episode else item['type'],
         }
 
         # Add title
-        if item.get('title'):
+        if get('title'):
             entry['title'] = item['title']
 
-        # Add watched_at if present
-        if 'watched_at' in item:
-            entry['watched_at'] = item['watched_at']
-
-        # Add watchlisted_at if present
-        if 'watchlisted_at' in item:
-            entry['watchlisted_at'] = item['watchlisted_at']
+        # Determine watched status
+        # Consider watched if progress > 90% or has watched icon
+        if get('is_watched', False) or progress > 90:
+            entry['watched_at'] = 'unknown' if mark_unknown_dates else now_iso
 
-        # Add rating if present (1-10)
-        if 'rating' in item:
-            entry['rating'] = item['rating']
-            if 'rated_at' in item:
-                entry['rated_at'] = item['rated_at']
+        # Add watchlisted_at for all items (this is the most important field)
+        if add_watchlist:
+            entry['watchlisted_at'] = now_iso
 
         # Add episode info for episodes
-        if item['type'] == 'episode':
-            entry['season'] = item.get('season')
-            entry['episode'] = item.get('episode')
-
-        # Add all extra fields (prefixed with _)
-        for key, value in item.items():
-            if key.startswith('_') and value is not None:
-                entry[key] = value
+        if is_episode:
+            entry['season'] = season
+            entry['episode'] = episode
+
+        # Add extra fields from HTML (prefixed with _, ignored by Trakt)
+        if get('href'):
+            entry['_href'] = item['href']
+        if get('poster_url'):
+            entry['_poster_url'] = item['poster_url']
+        if progress > 0:
+            entry['_progress'] = progress
+        if get('year'):
+            entry['_year'] = item['year']
+        if get('duration'):
+            entry['_duration'] = item['duration']
+        if get('episode_title'):
+            entry['_episode_title'] = item['episode_title']
+
+        yield entry
+
+
+if orjson is not None:
+    def _dumps(obj: object) -> str:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except orjson.JSONEncodeError:
+            # orjson rejects integers beyond 64 bits (e.g. an absurd season
+            # number in an href); json handles them, so use it for this entry
+            return json.dumps(obj, indent=2, ensure_ascii=False)
+else:
+    def _dumps(obj: object) -> str:
+        # Match orjson, which always emits UTF-8 rather than \u escapes
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+
+
+def write_json_array(entries: Iterable[dict], output: TextIO) -> int:
+    """
+    Write entries to output as an indented JSON array, one at a time.
 
-        formatted.append(entry)
+    The text matches json.dump(list(entries), output, indent=2,
+    ensure_ascii=False) but the full list is never held in memory. Entries
+    are serialized with orjson when it is installed.
 
-    return formatted
+    Returns the number of entries written.
+    """
+    count = 0
+    for entry in entries:
+        output.write(',\n  ' if count else '[\n  ')
+        output.write(_dumps(entry).replace('\n', '\n  '))
+        count += 1
+    output.write('\n]' if count else '[]')
+    return count
 
 
 def main() -> None:
@@ -327,13 +430,13 @@ def main() -> None:
     parser.add_argument(
         'input',
         nargs='?',
-        type=argparse.FileType('r'),
-        default=sys.stdin,
+        type=argparse.FileType('rb'),
+        default=sys.stdin.buffer,
         help='Input HTML file (or stdin)',
     )
     parser.add_argument(
         '-o', '--output',
-        type=argparse.FileType('w'),
+        type=argparse.FileType('w', encoding='utf-8'),
         default=sys.stdout,
         help='Output JSON file (default: stdout)',
     )
@@ -361,60 +464,88 @@ def main() -> None:
 
     args = parser.parse_args()
 
-    # Read HTML content
-    html_content = args.input.read()
+    # JSON output is always UTF-8, whatever the console encoding
+    if args.output is sys.stdout:
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    # Read HTML content in chunks, skipping leading whitespace
+    head = args.input.read(CHUNK_SIZE)
+    while head and not head.strip():
+        head = args.input.read(CHUNK_SIZE)
 
-    if not html_content.strip():
+    if not head:
         print("Error: Input is empty. Please provide a valid Stremio HTML export.", file=sys.stderr)
         sys.exit(1)
 
-    # Parse HTML
-    items = parse_stremio_html(html_content)
+    chunks = chain((head,), iter(lambda: args.input.read(CHUNK_SIZE), b''))
 
-    if not items:
+    # Parse HTML as it is read
+    items = iter_stremio_items(chunks)
+    first = next(items, None)
+
+    if first is None:
         print("Error: No media items found in the HTML.", file=sys.stderr)
         print("", file=sys.stderr)
         print("Make sure you're exporting from Stremio's Library page.", file=sys.stderr)
         print("The HTML should contain elements with 'meta-item-container' class.", file=sys.stderr)
         sys.exit(1)
 
-    # Count by type
-    movies = sum(1 for i in items if i.get('type') == 'movie')
-    shows = sum(1 for i in items if i.get('type') == 'show' and not i.get('season'))
-    episodes = sum(1 for i in items if i.get('season') is not None)
-    watched = sum(1 for i in items if i.get('is_watched') or i.get('progress', 0) > 90)
-
-    print(f"Found {len(items)} items: {movies} movies, {shows} shows, {episodes} episodes ({watched} watched)", file=sys.stderr)
-
-    # Filter by progress if specified (before conversion)
-    if args.min_progress > 0:
-        items = [
-            item for item in items
-            if item.get('progress', 0) >= args.min_progress
-        ]
-
-    # Filter to watched only if specified (before conversion)
-    if args.watched_only:
-        items = [
-            item for item in items
-            if item.get('is_watched', False) or item.get('progress', 0) > 90
-        ]
+    # Count by type and apply filters (before conversion) in one pass
+    # Flags are resolved once here so the per-item checks stay branch-light;
+    # progress is never negative, so a threshold of 0 passes every item
+    # (non-positive values and nan mean no progress filter, as before)
+    counts: Counter[str] = Counter()
+    min_progress = args.min_progress if args.min_progress > 0 else 0
+    watched_only = args.watched_only
+
+    def select(items: Iterable[dict]) -> Iterator[dict]:
+        for item in items:
+            get = item.get
+            item_type = get('type')
+            season = get('season')
+            progress = get('progress', 0)
+            # Consider watched if progress > 90% or has watched icon
+            is_watched = bool(get('is_watched') or progress > 90)
+
+            counts['items'] += 1
+            if item_type == 'movie':
+                counts['movies'] += 1
+            elif item_type == 'show' and not season:
+                counts['shows'] += 1
+            if season is not None:
+                counts['episodes'] += 1
+            if is_watched:
+                counts['watched'] += 1
+
+            if progress >= min_progress and (is_watched or not watched_only):
+                yield item
+
+    items = select(chain((first,), items))
 
     # Convert to Trakt format
-    trakt_items = convert_to_trakt_format(
+    output = convert_to_trakt_format(
         items,
         add_watchlist=not args.no_watchlist,
         mark_unknown_dates=not args.use_current_date
     )
 
-    # Format for Trakt import
-    output = format_for_trakt_import(trakt_items)
-
-    # Write output
-    json.dump(output, args.output, indent=2)
+    # Write output; if parsing fails part-way, leave an output file empty
+    # rather than holding a truncated array that looks like an export
+    try:
+        exported = write_json_array(output, args.output)
+    except BaseException:
+        if args.output is not sys.stdout:
+            args.output.seek(0)
+            args.output.truncate()
+        raise
     args.output.write('\n')
 
-    print(f"Exported {len(output)} items to Trakt format", file=sys.stderr)
+    print(
+        f"Found {counts['items']} items: {counts['movies']} movies, {counts['shows']} shows, "
+        f"{counts['episodes']} episodes ({counts['watched']} watched)",
+        file=sys.stderr,
+    )
+    print(f"Exported {exported} items to Trakt format", file=sys.stderr)
     if args.output != sys.stdout:
         print(f"Output written to: {args.output.name}", file=sys.stderr)
 